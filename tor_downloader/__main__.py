@@ -10,7 +10,10 @@ The command line arguments must be formatted like so:
 
 Configuration options:
     socks_port: Port of Tor Socks5 proxy.
+    tor_instances: Number of Tor instances to run, on consecutive ports starting at socks_port. Downloads are spread across them. Default is 1.
     max_downloads: Maximum number of downloads to run at once.
+    chunk_size: Number of bytes to read from the connection at a time when downloading. Default is 1048576 (1 MB).
+    async_downloads: Download with asyncio on one thread instead of a thread per download. Needs the "async" extra dependencies (aiohttp, aiohttp-socks and aiofiles). Default is false.
     max_tor_checks: Number of times the Tor proxy will be checked to ensure Tor is working before crashing. Default is 5.
     tor_path: Path to the Tor executable (tor.exe). Often found in Tor Browser if installed (Tor Browser\\Browser\\TorBrowser\\Tor\\tor.exe).
     links_file: Path to the file containing the list of URLs to download. Must be a .json file with a single list of URLs.
@@ -23,28 +26,77 @@ Example command:
 """
 
 # sourcery skip: assign-if-exp
-import json
+import asyncio
+import itertools
 import logging
+import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Tuple
 
 from stemquests import TorConnectionError, TorInstance
+from tqdm import tqdm
 
-from .file_downloader import FileDownloader
-from .utils import TDFormatter, TqdmLoggingHandler, get_download_links_json
+from .file_downloader import FileDownloader, download_files
+from .utils import TDFormatter, TqdmLoggingHandler, get_download_links_json, load_json_file, start_tor_instance
 
 CURRENT_PATH = Path(__file__).parent
 DEFAULT_CONFIG = {
     "socks_port": 9051,
+    "tor_instances": 1,
     "max_downloads": 7,
+    "chunk_size": 1024 * 1024,
+    "async_downloads": False,
     "links_file": CURRENT_PATH / "data\\input\\links.json",
     "log_file": CURRENT_PATH / "log\\TorDownloader.log",
     "output_dir": CURRENT_PATH / "data\\output"
 }
+# After an unexpected error the downloads are restarted up to MAX_RESTARTS times,
+# waiting RESTART_BACKOFF_BASE * 2^restart seconds (up to RESTART_BACKOFF_CAP seconds) first
+MAX_RESTARTS = 5
+RESTART_BACKOFF_BASE = 5
+RESTART_BACKOFF_CAP = 300
+# Number of jobs queued in the executor for each download that can run at once.
+# More than 1 so a worker never waits on the main thread for its next job.
+QUEUED_JOBS_PER_WORKER = 2
+# Downloads that fail to connect to Tor are retried up to MAX_TOR_RETRIES times, after every other download
+# has been tried, waiting TOR_RETRY_BACKOFF_BASE * 2^retry seconds (up to TOR_RETRY_BACKOFF_CAP seconds) first
+MAX_TOR_RETRIES = 5
+TOR_RETRY_BACKOFF_BASE = 5
+TOR_RETRY_BACKOFF_CAP = 60
+# Seconds to wait for the extra Tor instances to start, stem's launch timeout plus time for TorInstance's Tor check
+TOR_START_TIMEOUT = 180
+# Types to convert configuration options to, options not listed here are left as they are
+_COERCE = {
+    "socks_port": int,
+    "tor_instances": int,
+    "max_downloads": int,
+    "chunk_size": int,
+    "max_tor_checks": int,
+}
+_BOOLS = {"true": True, "false": False}
+_LOGGING_CONFIGURED = False
+
+def _coerce(key: str, value: str):
+    """Convert a command line value to the type of its option.
+
+    The strings "true" and "false" (in any case) are converted to booleans for every option.
+
+    Args:
+        key (str): Name of the configuration option.
+        value (str): Value to convert.
+
+    Returns:
+        Any: The converted value.
+    """
+    if value.lower() in _BOOLS:
+        return _BOOLS[value.lower()]
+    return _COERCE[key](value) if key in _COERCE else value
 
 def get_config_file(config_file: str) -> Dict:
     """Get configurations from a JSON file.
@@ -57,24 +109,21 @@ def get_config_file(config_file: str) -> Dict:
     Returns:
         Dict: Dictionary of configuration options.
     """
-    # Check if config.json exists, return empty dict if not
-    if not Path(config_file).exists():
+    # Load config.json, return empty dict if it does not exist
+    try:
+        loaded_config = load_json_file(config_file)
+    except FileNotFoundError:
         logging.warning("Config file '%s' does not exist.", config_file)
         return {}
 
     # Load config.json into a dictionary
     clean_config = {}
-    with open(config_file, "r", encoding="utf-8") as file:
-        for key, value in json.load(file).items():
-            # Do not load empty strings or None values into the config
-            if value == "" or value is None:
-                continue
-            # Convert the value to the correct type
-            match key:
-                case "socks_port" | "max_downloads" | "max_tor_checks":
-                    clean_config[key] = int(value)
-                case _:
-                    clean_config[key] = value.lower()
+    for key, value in loaded_config.items():
+        # Do not load empty strings or None values into the config
+        if value == "" or value is None:
+            continue
+        # JSON values already have their types, only options in _COERCE need converting
+        clean_config[key] = _COERCE[key](value) if key in _COERCE else value
     return clean_config
 
 def get_config_args() -> Dict:
@@ -89,20 +138,214 @@ def get_config_args() -> Dict:
     # Get config from command line arguments
     arg_dict = {}
     for arg in sys.argv[1:]:
-        arg_split = arg.split("=")
-        if len(arg_split) != 2:
+        arg_key, separator, arg_val = arg.partition("=")
+        if not separator or not arg_key:
             raise ValueError(f"Invalid command line argument: '{arg}'. Arguments must be formatted like so: 'CONFIG=SETTING'.")
-        arg_key, arg_val = arg_split
-        if arg_val.isnumeric():
-            arg_val = int(arg_val)
-        elif arg_val.lower() == "true":
-            arg_val = True
-        elif arg_val.lower() == "false":
-            arg_val = False
-        arg_dict[arg_key] = arg_val
+        arg_dict[arg_key] = _coerce(arg_key, arg_val)
 
     return arg_dict
 
+def _start_tor_in_background(port: int, tor_path: str=None) -> Future:
+    """Start a Tor instance on a daemon thread, so a Tor that never finishes starting can't keep the program running.
+
+    stem does not enforce its launch timeout off the main thread, wait on the returned future with a timeout instead.
+
+    Args:
+        port (int): Port of the Tor instance.
+        tor_path (str, optional): Path to the Tor executable. Defaults to getting Tor from path.
+
+    Returns:
+        Future: Future for the started Tor instance.
+    """
+    future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(start_tor_instance(port, tor_path, launch_timeout=None))
+        except Exception as err: # pylint: disable=broad-except
+            future.set_exception(err)
+
+    threading.Thread(target=run, name=f"start-tor-{port}", daemon=True).start()
+    return future
+
+def start_tor_pool(socks_port: int, num_instances: int, tor_path: str=None) -> List[TorInstance]:
+    """Start Tor instances on consecutive ports, starting at socks_port.
+
+    The first instance kills any old Tor processes, the rest are then started at the same time in the background.
+    Call this from the main thread, which waits up to TOR_START_TIMEOUT seconds for them to start.
+
+    Args:
+        socks_port (int): Port of the first Tor instance.
+        num_instances (int): Number of Tor instances to start.
+        tor_path (str, optional): Path to the Tor executable. Defaults to getting Tor from path.
+
+    Raises:
+        OSError: If a Tor instance fails to start, or does not start in time.
+
+    Returns:
+        List[TorInstance]: The started Tor instances.
+    """
+    tor_pool = [start_tor_instance(socks_port, tor_path, kill_old_tor=True)]
+    ports = range(socks_port + 1, socks_port + num_instances)
+    futures = [_start_tor_in_background(port, tor_path) for port in ports]
+    deadline = time.monotonic() + TOR_START_TIMEOUT
+    for port, future in zip(ports, futures):
+        try:
+            tor_pool.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except TimeoutError as err:
+            raise OSError(f"Tor on port {port} did not start within {TOR_START_TIMEOUT} seconds.") from err
+    return tor_pool
+
+def restart_dead_tor(tor_pool: List[TorInstance], tor_path: str=None) -> None:
+    """Restart any Tor instance in the pool whose Tor process has stopped, replacing it in the pool.
+
+    Args:
+        tor_pool (List[TorInstance]): Tor instances to check.
+        tor_path (str, optional): Path to the Tor executable. Defaults to getting Tor from path.
+    """
+    for index, tor_instance in enumerate(tor_pool):
+        if tor_instance.tor_process.poll() is None:
+            continue
+        logging.warning("Tor instance on port %d has stopped, restarting it.", tor_instance.port)
+        tor_pool[index] = start_tor_instance(tor_instance.port, tor_path)
+
+def _configure_logging(config: Dict) -> None:
+    """Set up the log file and TQDM console handlers on the root logger.
+
+    Only runs once per process, later calls (such as when main restarts) keep the existing handlers.
+
+    Args:
+        config (Dict): Configuration options, uses the "log_file" option.
+    """
+    global _LOGGING_CONFIGURED # pylint: disable=global-statement
+    if _LOGGING_CONFIGURED:
+        return
+    _LOGGING_CONFIGURED = True
+
+    # Setup logging
+    Path(config["log_file"]).parents[0].mkdir(parents=True, exist_ok=True) # Make the parent directories first
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    logger.handlers.clear()
+    # Add a rotating handler with a max of 100 MB, keeping 5 backup files
+    handler = RotatingFileHandler(config["log_file"], maxBytes=1024 * 1024 * 100, backupCount=5)
+    handler.setFormatter(logging.Formatter(fmt="%(asctime)s:%(levelname)s:%(name)s:%(message)s"))
+    logger.addHandler(handler)
+
+    # Print logs through TQDM, the tor_downloader logger propagates to this handler
+    tqdm_handler = TqdmLoggingHandler(logging.INFO)
+    tqdm_handler.setFormatter(TDFormatter())
+    logger.addHandler(tqdm_handler)
+
+def _run(CONFIG: Dict, download_links: List[str], tor_pool: List[TorInstance]) -> Dict:
+    """Download every link, giving the downloads to each Tor instance in turn.
+
+    Args:
+        CONFIG (Dict): Configuration options.
+        download_links (List[str]): URLs to download.
+        tor_pool (List[TorInstance]): Tor instances to download through.
+
+    Returns:
+        Dict: The result of each download (the file path, or the error) by URL.
+    """
+    logger = logging.getLogger()
+    # Create one downloader for each Tor instance, they are reused so downloads share open connections
+    downloaders = [FileDownloader(tor_instance=tor_instance, tor_port=tor_instance.port, pool_size=CONFIG["max_downloads"])
+                   for tor_instance in tor_pool]
+    downloader_cycle = itertools.cycle(downloaders)
+    files = {}
+    with ThreadPoolExecutor(max_workers=CONFIG["max_downloads"]) as executor, \
+         tqdm(total=len(download_links), unit="file", desc="Files", file=sys.stdout) as files_bar:
+        futures = {}
+
+        def submit(url: str, failed_downloader: FileDownloader=None) -> None:
+            # Retry on a different Tor instance than the one that failed
+            downloader = next(downloader_cycle)
+            if downloader is failed_downloader:
+                downloader = next(downloader_cycle)
+            future = executor.submit(downloader.download_file, url, target_dir=CONFIG["output_dir"], chunk_size=CONFIG["chunk_size"])
+            futures[future] = (url, downloader)
+            logger.debug("Submitted job for URL '%s' using session #%d on port %d.",
+                        url, downloader.session_num, downloader.tor_instance.port)
+
+        logger.info("Downloading %d links, %d at a time.", len(download_links), CONFIG["max_downloads"])
+        max_queued = QUEUED_JOBS_PER_WORKER * CONFIG["max_downloads"]
+        output_dir = os.fspath(CONFIG["output_dir"])
+        # Links that failed to connect to Tor, with the downloader they failed on, and how many times each was retried
+        retry_queue: List[Tuple[str, FileDownloader]] = []
+        retry_attempts: Dict[str, int] = {}
+        link_iter = ((download_link, None) for download_link in download_links)
+        while True:
+            # Only keep a few jobs queued at a time, submitting the next link whenever a download finishes
+            for download_link, failed_downloader in itertools.islice(link_iter, max_queued):
+                submit(download_link, failed_downloader)
+            # Get the results for the downloads
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, used_downloader = futures.pop(future)
+                    # TODO: Handle more exceptions by restarting the download
+                    future_exception = future.exception()
+                    if isinstance(future_exception, TorConnectionError):
+                        retry_attempts[url] = retry_attempts.get(url, 0) + 1
+                        if retry_attempts[url] <= MAX_TOR_RETRIES:
+                            logger.error("Could not connect to Tor for URL '%s', readding the URL to the queue.", url)
+                            retry_queue.append((url, used_downloader))
+                            continue
+                    if future_exception is not None:
+                        files[url] = future_exception
+                        logger.error("Error downloading %s: %s", url, future_exception)
+                        files_bar.update(1)
+                        continue
+                    # Finished downloads return their path in the output directory, failed ones return None
+                    if (result := future.result()) is not None and result.startswith(output_dir):
+                        logger.debug("Download finished! Filepath: %s | URL: %s", result, url)
+                    else:
+                        logger.error("Download failed! Reason: %s | URL: %s", result, url)
+                    files[url] = result
+                    files_bar.update(1)
+                # Top the queue back up with the next links
+                for download_link, failed_downloader in itertools.islice(link_iter, max(0, max_queued - len(futures))):
+                    submit(download_link, failed_downloader)
+            if not retry_queue:
+                break
+            # Give Tor some time to recover, then retry the links that failed to connect
+            retry_batch, retry_queue = retry_queue, []
+            retry_num = max(retry_attempts[url] for url, _ in retry_batch)
+            logger.info("Retrying %d link(s) that could not connect to Tor (retry #%d).", len(retry_batch), retry_num)
+            time.sleep(min(TOR_RETRY_BACKOFF_CAP, TOR_RETRY_BACKOFF_BASE * 2 ** (retry_num - 1)))
+            link_iter = iter(retry_batch)
+    return files
+
+def _run_async(CONFIG: Dict, download_links: List[str], tor_pool: List[TorInstance]) -> Dict:
+    """Download every link with asyncio on this thread, splitting the links evenly between the Tor instances.
+
+    Args:
+        CONFIG (Dict): Configuration options.
+        download_links (List[str]): URLs to download.
+        tor_pool (List[TorInstance]): Tor instances to download through.
+
+    Raises:
+        ImportError: If the "async" extra dependencies are not installed.
+
+    Returns:
+        Dict: The path of each download by URL, None for the downloads that failed.
+    """
+    logger = logging.getLogger()
+    logger.info("Downloading %d links with asyncio, %d at a time.", len(download_links), CONFIG["max_downloads"])
+    # Each Tor instance gets an equal share of the downloads that can run at once
+    concurrency = max(1, CONFIG["max_downloads"] // len(tor_pool))
+
+    async def download_all() -> List[Dict[str, str]]:
+        return await asyncio.gather(*(download_files(download_links[index::len(tor_pool)], CONFIG["output_dir"],
+                                                     tor_port=tor_instance.port, concurrency=concurrency,
+                                                     chunk_size=CONFIG["chunk_size"])
+                                      for index, tor_instance in enumerate(tor_pool)))
+
+    files = {url: result for instance_files in asyncio.run(download_all()) for url, result in instance_files.items()}
+    # Report the results in the order of the links file
+    return {url: files[url] for url in download_links}
+
 def main():
     """Main function for TorDownloader. Runs the program using system arguments or a config file."""
     # Check if user passed the "path" argument
@@ -120,80 +363,55 @@ def main():
     # Merge the config dictionaries, with the cmd arguments taking precedence
     CONFIG = {**file_config, **arg_config}
 
-    # Add a new line to the end of the log file before starting
-    Path(CONFIG["log_file"]).parents[0].mkdir(parents=True, exist_ok=True) # Make the parent directories first
-    with open(CONFIG["log_file"], "a", encoding="utf-8") as log_file:
-        log_file.write("\n")
-    # Setup logging
+    _configure_logging(CONFIG)
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
-    # Add a rotating handler with a max of 100 MB, keeping 5 backup files
-    handler = RotatingFileHandler(CONFIG["log_file"], maxBytes=1024 * 1024 * 100, backupCount=5)
-    handler.setFormatter(logging.Formatter(fmt="%(asctime)s:%(levelname)s:%(name)s:%(message)s"))
-    logger.addHandler(handler)
-
-    # Set up Tor Downloader logger
-    td_logger = logging.getLogger("tor_downloader")
-    tqdm_handler = TqdmLoggingHandler(logging.INFO)
-    tqdm_handler.setFormatter(TDFormatter())
-    td_logger.addHandler(tqdm_handler)
-    logger.addHandler(tqdm_handler)
 
+    # Marks the start of each run in the log file
+    logger.info("-"*25)
     logger.info("Starting TorDownloader on %s", datetime.now().isoformat())
-    logger.debug("Using config options: %s", str(CONFIG))
+    logger.debug("Using config options: %s", CONFIG)
 
-    download_links = get_download_links_json(CONFIG.get("links_file"))
+    # Read the links file in the background while the Tor instances start, since starting Tor takes a while.
+    # Tor is started on the main thread, stem only enforces its launch timeout there.
+    # Downloads are given to each Tor instance in turn
+    with ThreadPoolExecutor(max_workers=1) as startup_executor:
+        links_future = startup_executor.submit(get_download_links_json, CONFIG.get("links_file"))
+        tor_pool = start_tor_pool(CONFIG["socks_port"], CONFIG["tor_instances"], CONFIG.get("tor_path"))
+        download_links = links_future.result()
     if download_links is None:
         logger.error("Links file is empty.")
         return
+    # Remove duplicate links, keeping the order of the links file
+    unique_links = list(dict.fromkeys(download_links))
+    if len(unique_links) != len(download_links):
+        logger.info("Removed %d duplicate link(s).", len(download_links) - len(unique_links))
+    download_links = unique_links
 
-    # Create a Tor instance for the downloader
-    tor_instance = TorInstance(CONFIG["socks_port"], CONFIG.get("tor_path"))
-    files = {}
-    with ThreadPoolExecutor(max_workers=CONFIG["max_downloads"]) as executor:
+    for restart in range(MAX_RESTARTS + 1):
         try: # Catch keyboard interrupts and other exceptions
-            # Submit the jobs to the executor.
-            logger.info("Submitting %d jobs to the executor.", len(download_links))
-            futures = {}
-            for download_link in download_links:
-                downloader = FileDownloader(tor_instance=tor_instance, tor_port=CONFIG["socks_port"])
-                future = executor.submit(downloader.download_file, download_link, target_dir=CONFIG["output_dir"])
-                futures[future] = download_link
-                logger.info("Submitted job for URL '%s' using session #%d.", download_link, downloader.session_num) # TODO: Session number needs to be 1 less
-            logger.info("Submitted %d jobs to the executor.", len(futures))
-            # Get the results for the downloads
-            for future in as_completed(futures):
-                url = futures[future]
-                # TODO: Handle more exceptions by restarting the download
-                future_exception = future.exception()
-                if isinstance(future_exception, TorConnectionError):
-                    logger.error("Could not connect to Tor for URL '%s', readding the URL to the queue.", url)
-                    downloader = FileDownloader(tor_instance=tor_instance, tor_port=CONFIG["socks_port"])
-                    retry_url_future = executor.submit(downloader.download_file, url, target_dir=CONFIG["output_dir"])
-                    futures[retry_url_future] = url
-                    continue
-                if future_exception is not None:
-                    files[url] = future.exception()
-                    logger.error("Error downloading %s: %s", url, future.exception())
-                    continue
-                if str(CONFIG["output_dir"]) in (result := future.result()):
-                    logger.info("Download finished! Filepath: %s | URL: %s", result, url)
-                else:
-                    logger.error("Download failed! Reason: %s | URL: %s", result, url)
-                files[url] = result
-                logger.info("%d files finished so far.", len(files))
-        except ConnectionError:
-            logger.error("Connection error, restarting script...")
-            return main()
+            if CONFIG.get("async_downloads"):
+                files = _run_async(CONFIG, download_links, tor_pool)
+            else:
+                files = _run(CONFIG, download_links, tor_pool)
+            break
         except KeyboardInterrupt:
             # TODO: Fix this, it doesn't work. For now manually kill the program.
             logger.info("Keyboard Interrupt, stopping program...")
             sys.exit(1)
-        except Exception as err:
-            logger.error("Fatal Error, restarting script... Error: %s", err)
-            return main()
+        except ImportError as err:
+            # Restarting won't install the missing dependencies
+            logger.error("%s", err)
+            return
+        except ConnectionError:
+            logger.error("Connection error, restarting downloads...")
+        except Exception as err: # pylint: disable=broad-except
+            logger.error("Fatal Error, restarting downloads... Error: %s", err)
+        if restart == MAX_RESTARTS:
+            logger.error("Restarted %d times, stopping program.", MAX_RESTARTS)
+            return
+        time.sleep(min(RESTART_BACKOFF_CAP, RESTART_BACKOFF_BASE * 2 ** restart))
+        # Only restart Tor if it died, starting it again takes a while
+        restart_dead_tor(tor_pool, CONFIG.get("tor_path"))
 
     logger.info("-"*25)
     logger.info("All Downloads Finished:")
@@ -1,3 +1,5 @@
 from .check_tor import *
 from .download_links import *
+from .json_files import *
 from .logging_handlers import *
+from .tor_instances import *
@@ -1,18 +1,40 @@
 import logging
+import time
+import weakref
 
 import requests
 
 logger = logging.getLogger(__name__)
 
+# Tor Project endpoint that answers with a small JSON object like {"IsTor": true, "IP": "..."}
+CHECK_TOR_URL = "https://check.torproject.org/api/ip"
+# Seconds to trust a successful check before checking the session again
+CHECK_TOR_TTL = 300
+
+# Time each session was last seen using Tor, entries go away with their session
+_last_checked: "weakref.WeakKeyDictionary[requests.Session, float]" = weakref.WeakKeyDictionary()
+
 
 def check_tor(session: requests.Session) -> bool:
     """Check if Tor is working.
 
+    A session that passed the check in the last CHECK_TOR_TTL seconds is not checked again.
+
     Args:
         session (requests.Session): Requests session to check.
 
     Returns:
         bool: True if Tor is working, False otherwise.
     """
-    with session.get("https://check.torproject.org") as tor_check:
-        return "Congratulations. This browser is configured to use Tor." in tor_check.text
+    if (checked := _last_checked.get(session)) is not None and time.monotonic() - checked < CHECK_TOR_TTL:
+        return True
+    with session.get(CHECK_TOR_URL, timeout=10) as tor_check:
+        try:
+            is_tor = tor_check.json().get("IsTor", False) is True
+        except ValueError:
+            logger.warning("Unexpected response from %s: %s", CHECK_TOR_URL, tor_check.text[:100])
+            return False
+    # Only cache successes, a failed check is retried the next time
+    if is_tor:
+        _last_checked[session] = time.monotonic()
+    return is_tor
@@ -1,30 +1,65 @@
 """Functions to grab download links from web pages and JSON files."""
 
-import json
 import logging
 import re
-from typing import List
+from typing import Iterator, List, Union
 
 import requests
 
+from .json_files import load_json_file
+
 logger = logging.getLogger(__name__)
 
 
-def get_download_links_web(url: str, regex: str, session: requests.Session) -> List[str]:
+def _match_link(match: re.Match) -> Union[str, tuple]:
+    """Get the link from a regex match, the same way re.findall would.
+
+    Args:
+        match (re.Match): Match of the download link regex.
+
+    Returns:
+        Union[str, tuple]: The whole match if the regex has no groups, the group if it has one, otherwise a tuple of the groups.
+    """
+    match match.re.groups:
+        case 0:
+            return match.group(0)
+        case 1:
+            return match.groups("")[0]
+        case _:
+            return match.groups("")
+
+def iter_download_links_web(url: str, regex: Union[str, re.Pattern], session: requests.Session) -> Iterator[str]:
+    """Get download links from web page, yielding each link as it is found.
+
+    Args:
+        url (str): URL of web page.
+        regex (Union[str, re.Pattern]): Regex to extract download links, compiled once if given as a string.
+        session (requests.Session): Requests session to use.
+
+    Yields:
+        str: Download link.
+    """
+    pattern = regex if isinstance(regex, re.Pattern) else re.compile(regex)
+    site = session.get(url, verify=False).text
+    for match in pattern.finditer(site):
+        yield _match_link(match)
+
+def get_download_links_web(url: str, regex: Union[str, re.Pattern], session: requests.Session) -> List[str]:
     """Get download links from web page.
 
     Args:
         url (str): URL of web page.
-        regex (str): Regex to extract download links.
+        regex (Union[str, re.Pattern]): Regex to extract download links, compiled once if given as a string.
         session (requests.Session): Requests session to use.
 
     Returns:
         List[str]: List of download links.
     """
-    site = session.get(url, verify=False).text
-    links = re.findall(regex, site)
+    links = list(iter_download_links_web(url, regex, session))
     logger.info("Found %d links through url '%s'.", len(links), url)
-    logger.debug("Link list: %s", ", ".join(links))
+    # Only join the links if they will be logged, the list can be very long
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Link list: %s", ", ".join(links))
     return links
 
 def get_download_links_json(json_path: str) -> List[str]:
@@ -36,11 +71,12 @@ def get_download_links_json(json_path: str) -> List[str]:
     Returns:
         List[str]: List of download links.
     """
-    with open(json_path, "r", encoding="utf-8") as file:
-        links = json.load(file)
-        if len(links) == 0:
-            logger.error("JSON file '%s' is empty.", json_path)
-            return None
-        logger.info("Found %d link(s) in file '%s'", len(links), json_path)
+    links = load_json_file(json_path)
+    if len(links) == 0:
+        logger.error("JSON file '%s' is empty.", json_path)
+        return None
+    logger.info("Found %d link(s) in file '%s'", len(links), json_path)
+    # Only join the links if they will be logged, the list can be very long
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug("Link list: %s", ", ".join(links))
-        return links
+    return links
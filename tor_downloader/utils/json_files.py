@@ -0,0 +1,37 @@
+"""Function to load JSON files, using orjson if it is installed since it parses much faster than json."""
+
+import json
+import mmap
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# With orjson, files larger than this are memory-mapped and parsed in place instead of being read into memory first
+MMAP_THRESHOLD = 100 * 1024 * 1024
+
+
+def load_json_file(json_path: str) -> Any:
+    """Load a JSON file.
+
+    The file is read as bytes and parsed directly, skipping decoding it to a string first.
+
+    Args:
+        json_path (str): Path to JSON file.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+
+    Returns:
+        Any: The parsed JSON data.
+    """
+    with open(json_path, "rb") as file:
+        if orjson is None:
+            return json.loads(file.read())
+        if os.fstat(file.fileno()).st_size > MMAP_THRESHOLD:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file, memoryview(mapped_file) as view:
+                return orjson.loads(view)
+        return orjson.loads(file.read())
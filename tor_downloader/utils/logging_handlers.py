@@ -9,6 +9,9 @@ import logging
 import tqdm
 from colorama import Back, Fore, Style, init
 
+# Set up colorama once, calling init() again would wrap stdout and stderr again
+init()
+
 
 class TqdmLoggingHandler(logging.Handler):
     """Logging Handler for TQDM.
@@ -35,9 +38,16 @@ class TDFormatter(logging.Formatter):
     white = Fore.WHITE
     reset = Style.RESET_ALL
 
+    LEVEL_SYMBOLS = {
+        logging.DEBUG: "[?]",
+        logging.INFO: "[+]",
+        logging.WARN: "[-]",
+        logging.ERROR: "[*]",
+        logging.CRITICAL: "[***]"
+    }
+
     def __init__(self, fmt: str=""):
         super().__init__()
-        init()
         self.date_time_fmt = "%m-%d-%y %H:%M"
         self.time_fmt = f"{self.grey}(%(asctime)s){self.reset}"
         self.fmt = fmt or f"{self.time_fmt} %(levelname)s %(message)s"
@@ -50,6 +60,20 @@ class TDFormatter(logging.Formatter):
             logging.ERROR: self.red + Back.YELLOW,
             logging.CRITICAL: self.bold_red + Back.YELLOW
         }
+        # Build one formatter per level now instead of one per record
+        self._formatters = {level: self._level_formatter(level) for level in self.FORMATS}
+
+    def _level_formatter(self, level: int) -> logging.Formatter:
+        """Create the formatter for a log level, unknown levels are shown in white with the "[?]" symbol.
+
+        Args:
+            level (int): Log level to create the formatter for.
+
+        Returns:
+            logging.Formatter: Formatter for records with the given level.
+        """
+        level_fmt = self.FORMATS.get(level, self.white) + self.LEVEL_SYMBOLS.get(level, "[?]") + self.reset
+        return logging.Formatter(self.fmt.replace("%(levelname)s", level_fmt), self.date_time_fmt)
 
     def format(self, record: logging.LogRecord) -> str:
         """Formats a record.
@@ -60,27 +84,11 @@ class TDFormatter(logging.Formatter):
             WARN:     "%TIME [-] %MSG"
             ERROR:    "%TIME [*] %MSG"
             CRITICAL: "%TIME [***] %MSG"
+            Other:    "%TIME [?] %MSG"
         """
-        level_fmt = ""
-        level_color = self.FORMATS.get(record.levelno)
-        match record.levelno:
-            case logging.DEBUG:
-                level_fmt = level_color + "[?]" + self.reset
-            case logging.INFO:
-                level_fmt = level_color + "[+]" + self.reset
-            case logging.WARN:
-                level_fmt = level_color + "[-]" + self.reset
-            case logging.ERROR:
-                level_fmt = level_color + "[*]" + self.reset
-            case logging.CRITICAL:
-                level_fmt = level_color + "[***]" + self.reset
-            case _:
-                raise ValueError(f"Unknown log level: {record.levelno}")
-
-        log_format = self.fmt.replace("%(levelname)s", level_fmt)
-
-
-        formatter = logging.Formatter(log_format, self.date_time_fmt)
+        if (formatter := self._formatters.get(record.levelno)) is None:
+            # Custom levels get a formatter the first time they are logged
+            formatter = self._formatters.setdefault(record.levelno, self._level_formatter(record.levelno))
         return formatter.format(record)
 
 
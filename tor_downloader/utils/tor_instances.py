@@ -0,0 +1,35 @@
+"""Function to start Tor instances that can run next to each other."""
+
+from pathlib import Path
+from typing import Optional
+
+from stemquests import TorInstance
+
+# Each Tor instance keeps its data in TOR_DATA_DIR/<port>, inside the package so other users can't create it first
+TOR_DATA_DIR = Path(__file__).parent.parent / "data" / "tor"
+# Seconds stem waits for Tor to start, stem's own default
+TOR_LAUNCH_TIMEOUT = 90
+
+
+def start_tor_instance(port: int, tor_path: str=None, kill_old_tor: bool=False,
+                       launch_timeout: Optional[float]=TOR_LAUNCH_TIMEOUT) -> TorInstance:
+    """Start a Tor instance with its own data directory, since Tor locks the directory it is using.
+
+    Args:
+        port (int): Port of the Tor instance.
+        tor_path (str, optional): Path to the Tor executable. Defaults to getting Tor from path.
+        kill_old_tor (bool, optional): Whether to kill all running Tor processes first. Defaults to False.
+        launch_timeout (float, optional): Seconds to wait for Tor to start. stem can only enforce this on the main thread,
+                                          pass None on other threads and enforce a timeout there instead. Tor then stops
+                                          when this process exits, even if it never finishes starting. Defaults to 90.
+
+    Returns:
+        TorInstance: The started Tor instance.
+    """
+    data_dir = TOR_DATA_DIR / str(port)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    stem_config = {"config": {"SocksPort": str(port), "DataDirectory": str(data_dir)}, "timeout": launch_timeout}
+    if launch_timeout is None:
+        # Nothing else would stop a Tor that never finishes starting, so tie it to this process
+        stem_config["take_ownership"] = True
+    return TorInstance(port, tor_path, stem_config=stem_config, kill_old_tor=kill_old_tor)